@@ -0,0 +1,110 @@
+"""
+Reliance GRN PDF parsing helpers
+Kept free of Streamlit so they can run inside worker processes
+"""
+
+import os
+import re
+from datetime import datetime
+
+import fitz
+
+# Result columns, in display order
+METADATA_COLUMNS = [
+    "GRN No", "GRN Date", "Vendor Invoice No", "PO No", "PO Date", "Consignee Location",
+    "Truck No", "Challan No", "Source File", "Processing Date"
+]
+ITEM_COLUMNS = [
+    "S No", "Article", "Item Description", "EAN Number", "UoM",
+    "Challan Qty", "Received Qty", "Accepted Qty", "MRP"
+]
+
+# Compiled once at import so each worker process reuses them for every file
+GRN_PATTERNS = {
+    key: re.compile(pattern, re.IGNORECASE)
+    for key, pattern in {
+        "GRN No": r'GOODS RECEIPT NOTE No\.\s*:\s*(\S+)',
+        "GRN Date": r'Date:\s*(\d{2}\.\d{2}\.\d{4})',
+        "Vendor Invoice No": r'Vendor invoice no\s*:\s*(\S+)',
+        "Consignee Location": r'Consignee\s*:\s*([^\n]+)\n',
+        "PO No": r'PO Number\s*:\s*(\S+)',
+        "PO Date": r'PO Number.*?Date\s*:\s*(\d{2}\.\d{2}\.\d{4})|(?<!\S)Date\s*:\s*(\d{2}\.\d{2}\.\d{4})',
+        "Truck No": r'Truck/ Lorry/ Carrier No:\s*(\S+)',
+    }.items()
+}
+TABLE_START_PATTERN = re.compile(r'S No\s+Article', re.IGNORECASE)
+# The description is capped so a failed row can't scan the rest of the page; an
+# unbounded lazy class made junk-heavy pages quadratic (seconds to minutes per file)
+ITEM_DESCRIPTION_MAX = 250
+ITEM_PATTERN = re.compile(
+    r'(\d+)\s+(\d+)\s+([\w\s\.\-%#]{1,' + str(ITEM_DESCRIPTION_MAX) + r'}?)'
+    r'\s+(\d{13})\s+(\w+)\s+(\d+)\s+(\d+)\s+(\d+)\s+([\d\.]+)\b'
+)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Plain text only: no image blocks, and ligatures expanded so labels match as ASCII
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES & ~fitz.TEXT_PRESERVE_LIGATURES
+
+
+def extract_text_from_pdf(pdf_bytes):
+    """Extract text from PDF bytes"""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        # Encrypted GRNs would only yield empty pages, so fail fast with a clear reason
+        if doc.needs_pass:
+            raise ValueError("PDF is password protected")
+        return "".join(page.get_text("text", flags=TEXT_FLAGS) for page in doc)
+    finally:
+        doc.close()
+
+
+def extract_grn_data(text, source_filename=""):
+    """Extract GRN data from text with enhanced patterns"""
+    metadata = {
+        "GRN No": None, "GRN Date": None, "Vendor Invoice No": None, "PO No": None,
+        "PO Date": None, "Consignee Location": None, "Truck No": None, "Challan No": None,
+        "Source File": source_filename, "Processing Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+    for key, pattern in GRN_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            metadata[key] = match.group(1) or match.group(2)
+
+    if metadata["Vendor Invoice No"]:
+        metadata["Challan No"] = metadata["Vendor Invoice No"]
+
+    # Items are returned column-wise, one list per ITEM_COLUMNS entry
+    items = {column: [] for column in ITEM_COLUMNS}
+    table_start = TABLE_START_PATTERN.search(text)
+    if table_start:
+        # Scan from the table header in place rather than copying the rest of the text
+        for match in ITEM_PATTERN.finditer(text, table_start.start()):
+            description = WHITESPACE_PATTERN.sub(' ', match.group(3).strip())
+            items["S No"].append(match.group(1))
+            items["Article"].append(match.group(2))
+            items["Item Description"].append(description)
+            items["EAN Number"].append(match.group(4))
+            items["UoM"].append(match.group(5))
+            items["Challan Qty"].append(match.group(6))
+            items["Received Qty"].append(match.group(7))
+            items["Accepted Qty"].append(match.group(8))
+            items["MRP"].append(match.group(9))
+
+    return metadata, items
+
+
+def init_pdf_worker():
+    """Silence MuPDF diagnostics in a worker process; set GRN_MUPDF_ERRORS=1 to keep them"""
+    if os.environ.get("GRN_MUPDF_ERRORS") != "1":
+        fitz.TOOLS.mupdf_display_errors(False)
+        fitz.TOOLS.mupdf_display_warnings(False)
+
+
+def parse_grn_pdf(pdf_bytes, source_filename=""):
+    """Extract text and GRN data from one PDF; runs in a worker process"""
+    try:
+        return extract_grn_data(extract_text_from_pdf(pdf_bytes), source_filename)
+    finally:
+        # Drop cached fonts and images so long-lived workers don't grow with every file
+        fitz.TOOLS.store_shrink(100)
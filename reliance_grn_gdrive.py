@@ -6,16 +6,23 @@ Separate workflows for Manual Upload and Google Drive processing with hardcoded
 
 import streamlit as st
 import pandas as pd
-import re
-import fitz
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from io import BytesIO
-from collections import defaultdict
-import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+import queue
+import threading
 import json
+import hashlib
 import os
 import tempfile
+import uuid
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from functools import partial
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+
+from grn_parser import METADATA_COLUMNS, ITEM_COLUMNS, extract_grn_data, init_pdf_worker, parse_grn_pdf
 
 # Google API imports
 from google.oauth2.credentials import Credentials
@@ -23,6 +30,10 @@ from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+import xlsxwriter
 
 # Streamlit Config
 st.set_page_config(
@@ -32,216 +43,16 @@ st.set_page_config(
     page_icon="📦"
 )
 
-# Enhanced CSS for Modern UI
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-
-/* Global Styles */
-.main {
-    font-family: 'Inter', sans-serif;
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    min-height: 100vh;
-}
-
-.stApp {
-    background: transparent;
-}
-
-/* Header Styling */
-.main-header {
-    background: rgba(255, 255, 255, 0.98);
-    backdrop-filter: blur(25px);
-    border-radius: 20px;
-    padding: 2rem;
-    margin-bottom: 2rem;
-    box-shadow: 0 25px 50px rgba(0, 0, 0, 0.15);
-    border: 1px solid rgba(255, 255, 255, 0.3);
-    text-align: center;
-}
-
-.main-title {
-    font-size: 3rem;
-    font-weight: 700;
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    -webkit-background-clip: text;
-    -webkit-text-fill-color: transparent;
-    margin-bottom: 0.5rem;
-    text-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-}
-
-.main-subtitle {
-    font-size: 1.2rem;
-    color: #64748b;
-    font-weight: 400;
-    margin-bottom: 0;
-}
-
-/* Card Styling */
-.glass-card {
-    background: rgba(255, 255, 255, 0.98);
-    backdrop-filter: blur(20px);
-    border-radius: 20px;
-    padding: 2rem;
-    box-shadow: 0 20px 40px rgba(0, 0, 0, 0.15);
-    border: 1px solid rgba(255, 255, 255, 0.3);
-    margin-bottom: 2rem;
-}
-
-.workflow-section {
-    background: rgba(255, 255, 255, 0.95);
-    backdrop-filter: blur(20px);
-    border-radius: 20px;
-    padding: 2.5rem;
-    box-shadow: 0 20px 40px rgba(0, 0, 0, 0.1);
-    border: 2px solid rgba(102, 126, 234, 0.2);
-    margin-bottom: 2rem;
-    border-left: 6px solid #667eea;
-}
-
-.upload-zone {
-    background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-    border: 2px dashed #667eea;
-    border-radius: 16px;
-    padding: 3rem 2rem;
-    text-align: center;
-    transition: all 0.3s ease;
-}
-
-.upload-zone:hover {
-    background: linear-gradient(135deg, rgba(102, 126, 234, 0.15) 0%, rgba(118, 75, 162, 0.15) 100%);
-    transform: translateY(-2px);
-    box-shadow: 0 10px 25px rgba(102, 126, 234, 0.2);
-}
-
-/* Metrics Cards */
-.metric-card {
-    background: rgba(255, 255, 255, 0.95);
-    backdrop-filter: blur(15px);
-    border-radius: 16px;
-    padding: 1.5rem;
-    text-align: center;
-    border: 1px solid rgba(255, 255, 255, 0.4);
-    box-shadow: 0 10px 25px rgba(0, 0, 0, 0.15);
-    flex: 1;
-    transition: all 0.3s ease;
-}
-
-.metric-card:hover {
-    transform: translateY(-4px);
-    box-shadow: 0 15px 35px rgba(0, 0, 0, 0.2);
-    background: rgba(255, 255, 255, 0.98);
-}
-
-.metric-value {
-    font-size: 2.5rem;
-    font-weight: 700;
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    -webkit-background-clip: text;
-    -webkit-text-fill-color: transparent;
-    margin-bottom: 0.5rem;
-    display: block;
-}
-
-.metric-label {
-    color: #64748b;
-    font-size: 0.9rem;
-    font-weight: 500;
-    text-transform: uppercase;
-    letter-spacing: 0.5px;
-}
-
-/* Section Headers */
-.section-header {
-    font-size: 2rem;
-    font-weight: 600;
-    color: #667eea;
-    margin-bottom: 1.5rem;
-    padding-bottom: 0.5rem;
-    border-bottom: 3px solid #667eea;
-    display: flex;
-    align-items: center;
-    gap: 1rem;
-}
-
-.section-icon {
-    font-size: 2.5rem;
-}
-
-/* Buttons */
-.primary-btn {
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    color: white;
-    border: none;
-    border-radius: 12px;
-    padding: 1rem 2rem;
-    font-weight: 600;
-    font-size: 1.1rem;
-    transition: all 0.3s ease;
-    box-shadow: 0 4px 15px rgba(102, 126, 234, 0.3);
-    width: 100%;
-    margin: 0.5rem 0;
-}
-
-.primary-btn:hover {
-    transform: translateY(-2px);
-    box-shadow: 0 8px 25px rgba(102, 126, 234, 0.4);
-    background: linear-gradient(135deg, #5a67d8 0%, #6b5b95 100%);
-}
-
-.drive-btn {
-    background: linear-gradient(135deg, #10b981 0%, #059669 100%) !important;
-    box-shadow: 0 4px 15px rgba(16, 185, 129, 0.3) !important;
-}
-
-.drive-btn:hover {
-    background: linear-gradient(135deg, #059669 0%, #047857 100%) !important;
-    box-shadow: 0 8px 25px rgba(16, 185, 129, 0.4) !important;
-}
-
-/* Status indicators */
-.status-success {
-    background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-    color: white;
-    padding: 0.5rem 1rem;
-    border-radius: 8px;
-    font-weight: 500;
-    display: inline-block;
-    margin: 0.5rem 0;
-}
-
-.status-warning {
-    background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
-    color: white;
-    padding: 0.5rem 1rem;
-    border-radius: 8px;
-    font-weight: 500;
-    display: inline-block;
-    margin: 0.5rem 0;
-}
+# Enhanced CSS for Modern UI, kept in static/style.css
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
 
-/* Animation Classes */
-@keyframes fadeInUp {
-    from {
-        opacity: 0;
-        transform: translateY(30px);
-    }
-    to {
-        opacity: 1;
-        transform: translateY(0);
-    }
-}
+@st.cache_data(show_spinner=False)
+def load_css(path: str) -> str:
+    """Read a stylesheet from disk once per server process"""
+    with open(path, encoding="utf-8") as css_file:
+        return css_file.read()
 
-.animate-fade-in {
-    animation: fadeInUp 0.6s ease-out;
-}
-
-/* Hide Streamlit Branding */
-#MainMenu {visibility: hidden;}
-footer {visibility: hidden;}
-.stDeployButton {display:none;}
-</style>
-""", unsafe_allow_html=True)
+st.markdown(f"<style>\n{load_css(CSS_PATH)}</style>", unsafe_allow_html=True)
 
 # Hardcoded Configuration based on the image
 HARDCODED_CONFIG = {
@@ -260,10 +71,78 @@ HARDCODED_CONFIG = {
     }
 }
 
+# Concurrent Drive downloads; Google API reads retry with exponential backoff on 429/5xx
+DRIVE_DOWNLOAD_WORKERS = 16
+# Upper bound on PDF parsing processes; each one loads PyMuPDF and holds the PDFs it is sent
+PDF_PARSE_WORKERS = 4
+DOWNLOAD_QUEUE_SIZE = 8
+DRIVE_DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+GOOGLE_API_RETRIES = 5
+# Drive's maximum files.list page size, so typical folders list in a single request
+DRIVE_LIST_PAGE_SIZE = 1000
+# Rows per Sheets append request, keeping each payload well under the 10 MB request limit
+SHEETS_APPEND_CHUNK_ROWS = 10000
+# Seconds a remembered sheet name and header row stay valid before they are looked up again
+SHEET_LAYOUT_TTL = 3600
+# Characters that force a CSV field to be quoted
+CSV_QUOTE_CHARS = ',"\r\n'
+
+# Explicit column order keeps result frames stable whichever file comes first
+MANUAL_RESULT_COLUMNS = METADATA_COLUMNS + ITEM_COLUMNS + ["file_name", "source"]
+DRIVE_RESULT_COLUMNS = MANUAL_RESULT_COLUMNS + ["drive_file_id"]
+# Fields read from the PDF itself; a row with none of them carries no GRN data
+EXTRACTED_COLUMNS = [
+    column for column in METADATA_COLUMNS if column not in ("Source File", "Processing Date")
+] + ITEM_COLUMNS
+# Identifies one GRN line item across files
+GRN_LINE_KEY = ["GRN No", "S No", "Article"]
+# Columns that repeat per file or per source; stored as categoricals in result frames
+CATEGORICAL_RESULT_COLUMNS = METADATA_COLUMNS + ["file_name", "source"]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_drive_listing(credentials_fingerprint: str, folder_id: str, days_back: int, max_files: int,
+                        _drive_service) -> List[Dict]:
+    """Fetch the PDF listing for a Drive folder, cached per user for five minutes"""
+    start_datetime = datetime.utcnow() - timedelta(days=days_back)
+    start_str = start_datetime.strftime('%Y-%m-%dT00:00:00Z')
+    
+    query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false and createdTime > '{start_str}'"
+    
+    files = []
+    page_token = None
+    
+    while len(files) < max_files:
+        results = _drive_service.files().list(
+            q=query,
+            fields="nextPageToken, files(id, name, createdTime, modifiedTime, size)",
+            pageToken=page_token,
+            orderBy="createdTime desc",
+            pageSize=min(DRIVE_LIST_PAGE_SIZE, max_files - len(files))
+        ).execute(num_retries=GOOGLE_API_RETRIES)
+        
+        batch_files = results.get('files', [])
+        files.extend(batch_files)
+        
+        page_token = results.get('nextPageToken')
+        if not page_token or len(batch_files) == 0:
+            break
+    
+    return files[:max_files]
+
+def build_google_services(creds: Credentials):
+    """Build Drive/Sheets clients for one session's credentials"""
+    # Not shared across sessions: each client owns an httplib2.Http, which is not thread-safe
+    drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    sheets_service = build('sheets', 'v4', credentials=creds, cache_discovery=False)
+    return drive_service, sheets_service
+
 class RelianceGRNProcessor:
     def __init__(self):
+        self.credentials = None
         self.drive_service = None
         self.sheets_service = None
+        self.token_json = None
+        self.thread_local = threading.local()
         self.scopes = [
             'https://www.googleapis.com/auth/drive.readonly',
             'https://www.googleapis.com/auth/spreadsheets'
@@ -278,11 +157,15 @@ class RelianceGRNProcessor:
             # Check for existing token in session state
             if 'oauth_token' in st.session_state:
                 try:
-                    creds = Credentials.from_authorized_user_info(st.session_state.oauth_token, self.scopes)
-                    if creds and creds.valid:
-                        progress_bar.progress(50)
-                        self.drive_service = build('drive', 'v3', credentials=creds)
-                        self.sheets_service = build('sheets', 'v4', credentials=creds)
+                    # This session's clients are reused across reruns until the token changes
+                    token_json = json.dumps(st.session_state.oauth_token, sort_keys=True)
+                    if token_json != self.token_json:
+                        creds = Credentials.from_authorized_user_info(st.session_state.oauth_token, self.scopes)
+                        if creds and creds.valid:
+                            self.credentials = creds
+                            self.drive_service, self.sheets_service = build_google_services(creds)
+                            self.token_json = token_json
+                    if token_json == self.token_json and self.credentials.valid:
                         progress_bar.progress(100)
                         status_text.text("Authentication successful!")
                         return True
@@ -315,8 +198,9 @@ class RelianceGRNProcessor:
                         st.session_state.oauth_token = json.loads(creds.to_json())
                         
                         progress_bar.progress(50)
-                        self.drive_service = build('drive', 'v3', credentials=creds)
-                        self.sheets_service = build('sheets', 'v4', credentials=creds)
+                        self.credentials = creds
+                        self.drive_service, self.sheets_service = build_google_services(creds)
+                        self.token_json = json.dumps(st.session_state.oauth_token, sort_keys=True)
                         progress_bar.progress(100)
                         status_text.text("Authentication successful!")
                         
@@ -340,6 +224,10 @@ class RelianceGRNProcessor:
             st.error(f"Authentication failed: {str(e)}")
             return False
     
+    def credentials_fingerprint(self) -> str:
+        """Stable hash of the current access token, used to scope cached Drive data per user"""
+        return hashlib.sha256(self.credentials.token.encode()).hexdigest()
+    
     def list_drive_files(self, folder_id: str, days_back: int = 7, max_files: int = 1000) -> List[Dict]:
         """List PDF files in Drive folder"""
         try:
@@ -347,51 +235,67 @@ class RelianceGRNProcessor:
                 st.error("No folder ID provided")
                 return []
             
-            start_datetime = datetime.utcnow() - timedelta(days=days_back)
-            start_str = start_datetime.strftime('%Y-%m-%dT00:00:00Z')
-            
-            query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false and createdTime > '{start_str}'"
-            
-            files = []
-            page_token = None
-            
-            while len(files) < max_files:
-                results = self.drive_service.files().list(
-                    q=query,
-                    fields="nextPageToken, files(id, name, createdTime, size)",
-                    pageToken=page_token,
-                    orderBy="createdTime desc",
-                    pageSize=min(100, max_files - len(files))
-                ).execute()
-                
-                batch_files = results.get('files', [])
-                files.extend(batch_files)
-                
-                page_token = results.get('nextPageToken')
-                if not page_token or len(batch_files) == 0:
-                    break
+            files = fetch_drive_listing(
+                self.credentials_fingerprint(), folder_id, days_back, max_files, self.drive_service
+            )
             
             st.info(f"Found {len(files)} PDF files in Drive folder")
-            return files[:max_files]
+            return files
             
         except Exception as e:
             st.error(f"Failed to list Drive files: {str(e)}")
             return []
     
     def download_from_drive(self, file_id: str) -> bytes:
-        """Download file from Drive"""
+        """Download file from Drive; safe to call from worker threads"""
+        # httplib2 connections are not thread-safe, so each thread gets its own
+        http = getattr(self.thread_local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+            self.thread_local.http = http
+        request = self.drive_service.files().get_media(fileId=file_id)
+        request.http = http
+        buffer = BytesIO()
+        downloader = MediaIoBaseDownload(buffer, request, chunksize=DRIVE_DOWNLOAD_CHUNK_SIZE)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk(num_retries=GOOGLE_API_RETRIES)
+        return buffer.getvalue()
+    
+    def iter_downloads(self, file_ids: List[str]) -> Iterator[Tuple[str, bytes]]:
+        """Download Drive files concurrently, yielding (file_id, bytes) as each one finishes"""
+        # A bounded queue applies backpressure: downloads pause while the
+        # consumer is busy instead of holding every PDF in memory at once
+        ready = queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+
+        def fetch(file_id):
+            try:
+                ready.put((file_id, self.download_from_drive(file_id), None))
+            except Exception as e:
+                ready.put((file_id, b"", e))
+
+        executor = ThreadPoolExecutor(max_workers=DRIVE_DOWNLOAD_WORKERS)
+        futures = [executor.submit(fetch, file_id) for file_id in file_ids]
         try:
-            request = self.drive_service.files().get_media(fileId=file_id)
-            file_data = request.execute()
-            return file_data
-        except Exception as e:
-            st.error(f"Failed to download file {file_id}: {str(e)}")
-            return b""
+            for _ in futures:
+                file_id, file_data, error = ready.get()
+                if error:
+                    st.error(f"Failed to download file {file_id}: {str(error)}")
+                yield file_id, file_data
+        finally:
+            # Drain the queue so workers blocked on put() can exit if the consumer stopped early
+            executor.shutdown(wait=False, cancel_futures=True)
+            while not all(future.done() for future in futures):
+                try:
+                    ready.get(timeout=0.1)
+                except queue.Empty:
+                    pass
     
-    def append_to_sheet(self, sheet_id: str, data: List[Dict], progress_bar=None, status_text=None):
-        """Append data to Google Sheet"""
+    def append_to_sheet(self, sheet_id: str, df: pd.DataFrame, progress_bar=None, status_text=None,
+                        upload_id: Optional[str] = None):
+        """Append a results DataFrame to Google Sheet, resuming a partly failed upload with the same upload_id"""
         try:
-            if not data:
+            if df.empty:
                 st.warning("No data to append to sheet")
                 return False
             
@@ -400,56 +304,68 @@ class RelianceGRNProcessor:
             if progress_bar:
                 progress_bar.progress(10)
             
-            # Convert data to DataFrame for easier manipulation
-            df = pd.DataFrame(data)
+            # Skip rows where nothing was extracted, and GRN lines repeated within this upload
+            keep = df[EXTRACTED_COLUMNS].notna().any(axis=1)
+            keep &= ~(df[GRN_LINE_KEY].notna().all(axis=1) & df.duplicated(subset=GRN_LINE_KEY))
+            if not keep.all():
+                st.info(f"Skipping {(~keep).sum()} empty or duplicate rows")
+                df = df[keep]
+                if df.empty:
+                    st.warning("No data to append to sheet")
+                    return False
+            
+            # Get existing sheet headers to match column order; the layout is remembered
+            # per sheet for this session so repeat uploads skip both lookups
+            sheet_layouts = st.session_state.sheet_layouts
+            layout = sheet_layouts.get(sheet_id)
+            if layout and datetime.now() - layout[2] < timedelta(seconds=SHEET_LAYOUT_TTL):
+                sheet_name, existing_headers, _ = layout
+            else:
+                try:
+                    sheet_metadata = self.sheets_service.spreadsheets().get(
+                        spreadsheetId=sheet_id, fields='sheets.properties.title'
+                    ).execute(num_retries=GOOGLE_API_RETRIES)
+                    sheet_name = sheet_metadata['sheets'][0]['properties']['title']  # Use first sheet
+                    
+                    # Get existing headers
+                    header_range = f"{sheet_name}!1:1"
+                    header_result = self.sheets_service.spreadsheets().values().get(
+                        spreadsheetId=sheet_id, range=header_range
+                    ).execute(num_retries=GOOGLE_API_RETRIES)
+                    
+                    existing_headers = header_result.get('values', [[]])[0] if header_result.get('values') else []
+                    
+                except Exception as e:
+                    st.warning(f"Could not read existing headers: {e}")
+                    existing_headers = []
+                    sheet_name = 'Sheet1'  # Default sheet name
             
-            # Get existing sheet headers to match column order
-            try:
-                sheet_metadata = self.sheets_service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-                sheet_name = sheet_metadata['sheets'][0]['properties']['title']  # Use first sheet
-                
-                # Get existing headers
-                header_range = f"{sheet_name}!1:1"
-                header_result = self.sheets_service.spreadsheets().values().get(
-                    spreadsheetId=sheet_id, range=header_range
-                ).execute()
-                
-                existing_headers = header_result.get('values', [[]])[0] if header_result.get('values') else []
-                
-                if progress_bar:
-                    progress_bar.progress(30)
-                
-            except Exception as e:
-                st.warning(f"Could not read existing headers: {e}")
-                existing_headers = []
-                sheet_name = 'Sheet1'  # Default sheet name
+            if progress_bar:
+                progress_bar.progress(30)
             
             # Prepare data rows
             if existing_headers:
-                # Reorder columns to match existing sheet
-                df_ordered = pd.DataFrame()
-                for header in existing_headers:
-                    if header in df.columns:
-                        df_ordered[header] = df[header]
-                    else:
-                        df_ordered[header] = ''  # Empty column for missing data
-                
-                # Add any new columns not in existing headers
-                for col in df.columns:
-                    if col not in existing_headers:
-                        df_ordered[col] = df[col]
-                
-                df = df_ordered
+                # Reorder columns to match existing sheet, blank for missing data,
+                # followed by any new columns not in existing headers
+                new_columns = [col for col in df.columns if col not in existing_headers]
+                df = df.reindex(columns=existing_headers + new_columns, fill_value='')
             
             if status_text:
                 status_text.text("Converting data to sheet format...")
             if progress_bar:
                 progress_bar.progress(50)
             
-            # Convert DataFrame to list of lists for Google Sheets API
-            values = df.fillna('').astype(str).values.tolist()
+            # Rows already appended by an earlier attempt at this upload are not sent again
+            rows_sent = st.session_state.sheet_rows_sent
+            upload_key = (sheet_id, upload_id)
+            sent = rows_sent.get(upload_key, 0) if upload_id else 0
+            
+            # Convert DataFrame to list of lists for Google Sheets API in one pass; missing
+            # values (None/NaN/NA, including in categorical columns) become empty cells
+            values = df.iloc[sent:].astype(object).where(lambda d: d.notna(), '').astype(str).values.tolist()
             
             # If no existing headers, add headers as first row
+            header_rows = 0 if existing_headers else 1
             if not existing_headers:
                 headers = list(df.columns)
                 values.insert(0, headers)
@@ -459,28 +375,41 @@ class RelianceGRNProcessor:
             if progress_bar:
                 progress_bar.progress(70)
             
-            # Append data to sheet
-            body = {
-                'values': values
-            }
-            
+            # Append data to sheet, in chunks that stay under the API's request size limit
             range_name = f"{sheet_name}!A:Z"  # Append to end of sheet
+            rows_added = 0
             
-            result = self.sheets_service.spreadsheets().values().append(
-                spreadsheetId=sheet_id,
-                range=range_name,
-                valueInputOption='USER_ENTERED',
-                insertDataOption='INSERT_ROWS',
-                body=body
-            ).execute()
-            
-            if progress_bar:
-                progress_bar.progress(100)
+            try:
+                for start in range(0, len(values), SHEETS_APPEND_CHUNK_ROWS):
+                    # Not retried: repeating an append whose response was lost would duplicate rows
+                    result = self.sheets_service.spreadsheets().values().append(
+                        spreadsheetId=sheet_id,
+                        range=range_name,
+                        valueInputOption='USER_ENTERED',
+                        insertDataOption='INSERT_ROWS',
+                        body={'values': values[start:start + SHEETS_APPEND_CHUNK_ROWS]}
+                    ).execute()
+                    rows_added += result.get('updates', {}).get('updatedRows', 0)
+                    sent += len(values[start:start + SHEETS_APPEND_CHUNK_ROWS]) - (header_rows if start == 0 else 0)
+                    
+                    if progress_bar:
+                        progress_bar.progress(70 + 30 * min(len(values), start + SHEETS_APPEND_CHUNK_ROWS) // len(values))
+            except Exception:
+                # The sheet may have been renamed or restructured; look it up again next time
+                sheet_layouts.pop(sheet_id, None)
+                if upload_id:
+                    rows_sent[upload_key] = sent
+                if rows_added:
+                    st.warning(f"Only {rows_added} rows were added before the upload failed; "
+                               f"retrying sends the remaining rows")
+                raise
+            
+            rows_sent.pop(upload_key, None)
+            sheet_layouts[sheet_id] = (sheet_name, existing_headers or list(df.columns), datetime.now())
             
             if status_text:
                 status_text.text("✅ Data successfully uploaded to Google Sheets!")
             
-            rows_added = result.get('updates', {}).get('updatedRows', 0)
             st.success(f"Successfully added {rows_added} rows to Google Sheets!")
             
             return True
@@ -488,79 +417,217 @@ class RelianceGRNProcessor:
         except Exception as e:
             st.error(f"Failed to append data to Google Sheets: {str(e)}")
             return False
-    
-    def clean_text(self, text):
-        """Clean extracted text"""
-        return text.strip().replace('\n', ' ').replace('\r', ' ').replace('  ', ' ')
 
-    def extract_text_from_pdf(self, pdf_bytes):
-        """Extract text from PDF bytes"""
+def get_processor() -> RelianceGRNProcessor:
+    """Return this session's processor, creating it on first use"""
+    # Kept per session rather than in st.cache_resource, which would share credentials across users
+    if 'processor' not in st.session_state:
+        st.session_state.processor = RelianceGRNProcessor()
+    return st.session_state.processor
+
+def create_pdf_executor(num_files: int) -> Optional[ProcessPoolExecutor]:
+    """Create a process pool for PDF parsing, or None when a single worker would gain nothing"""
+    # os.cpu_count() reports the host's cores; the affinity mask reflects what this process may use
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    workers = min(cpus, num_files, PDF_PARSE_WORKERS)
+    if workers <= 1:
+        return None
+    # Forking this multithreaded server can deadlock a child on a lock held by another thread;
+    # workers only need grn_parser, which imports without Streamlit, so start them clean instead
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=init_pdf_worker
+    )
+
+def parse_pdf_batch(pdfs: Iterable[tuple], total: int, progress_bar, status_text) -> List[tuple]:
+    """Parse (position, name, pdf_bytes) entries as they arrive, returning (position, metadata, items, ok) sorted by position"""
+    # Entries whose pdf_bytes is None (e.g. failed downloads) only advance the progress bar
+    if not total:
+        progress_bar.progress(1.0)
+        return []
+    results = {}
+    futures = {}
+    skipped = 0
+    # Each progress/status update is a websocket message, so refresh at most ~100 times per batch
+    update_step = max(1, total // 100)
+    shown = 0
+
+    def collect(future):
+        nonlocal shown
+        position, name = futures.pop(future)
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            return text
+            metadata, items = future.result()
+            ok = True
         except Exception as e:
             st.error(f"Failed to extract text from PDF: {str(e)}")
-            return ""
-
-    def extract_grn_data(self, text, source_filename=""):
-        """Extract GRN data from text with enhanced patterns"""
-        metadata = {
-            "GRN No": None, "GRN Date": None, "Vendor Invoice No": None, "PO No": None,
-            "PO Date": None, "Consignee Location": None, "Truck No": None, "Challan No": None,
-            "Source File": source_filename, "Processing Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-
-        patterns = {
-            "GRN No": r'GOODS RECEIPT NOTE No\.\s*:\s*(\S+)',
-            "GRN Date": r'Date:\s*(\d{2}\.\d{2}\.\d{4})',
-            "Vendor Invoice No": r'Vendor invoice no\s*:\s*(\S+)',
-            "Consignee Location": r'Consignee\s*:\s*([^\n]+)\n',
-            "PO No": r'PO Number\s*:\s*(\S+)',
-            "PO Date": r'PO Number.*?Date\s*:\s*(\d{2}\.\d{2}\.\d{4})|(?<!\S)Date\s*:\s*(\d{2}\.\d{2}\.\d{4})',
-            "Truck No": r'Truck/ Lorry/ Carrier No:\s*(\S+)',
-        }
-
-        for key, pattern in patterns.items():
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                metadata[key] = match.group(1) or match.group(2)
-
-        if metadata["Vendor Invoice No"]:
-            metadata["Challan No"] = metadata["Vendor Invoice No"]
-
-        items = []
-        table_start = re.search(r'S No\s+Article', text, re.IGNORECASE)
-        if table_start:
-            table_text = text[table_start.start():]
-            item_pattern = re.compile(
-                r'(\d+)\s+(\d+)\s+([\w\s\.\-%#]+?)\s+(\d{13})\s+(\w+)\s+(\d+)\s+(\d+)\s+(\d+)\s+([\d\.]+)\b'
-            )
-            for match in item_pattern.finditer(table_text):
-                description = re.sub(r'\s+', ' ', match.group(3).strip())
-                items.append({
-                    "S No": match.group(1), 
-                    "Article": match.group(2), 
-                    "Item Description": description,
-                    "EAN Number": match.group(4), 
-                    "UoM": match.group(5), 
-                    "Challan Qty": match.group(6),
-                    "Received Qty": match.group(7), 
-                    "Accepted Qty": match.group(8), 
-                    "MRP": match.group(9)
-                })
-
-        return metadata, items
+            metadata, items = extract_grn_data("", name)
+            ok = False
+        results[position] = (position, metadata, items, ok)
+        done = len(results) + skipped
+        if done - shown >= update_step or done == total:
+            shown = done
+            status_text.text(f"Processed: {name}")
+            progress_bar.progress(done / total)
+
+    executor = create_pdf_executor(total)
+    try:
+        for position, name, pdf_bytes in pdfs:
+            if pdf_bytes is None:
+                skipped += 1
+                continue
+            if executor is None:
+                # One worker would only add pool startup and pickling, so parse in-process
+                future = Future()
+                try:
+                    future.set_result(parse_grn_pdf(pdf_bytes, name))
+                except Exception as e:
+                    future.set_exception(e)
+                futures[future] = (position, name)
+                collect(future)
+                continue
+            try:
+                future = executor.submit(parse_grn_pdf, pdf_bytes, name)
+            except Exception as e:
+                # A crashed worker breaks the whole pool: fail this file and continue on a fresh pool
+                future = Future()
+                future.set_exception(e)
+                executor.shutdown(wait=False)
+                executor = create_pdf_executor(total)
+            futures[future] = (position, name)
+            for future in [future for future in futures if future.done()]:
+                collect(future)
+        for future in as_completed(list(futures)):
+            collect(future)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    progress_bar.progress(1.0)
+    return [results[position] for position in sorted(results)]
+
+def append_file_rows(columns: Dict[str, list], metadata: Dict[str, Any], items: Dict[str, list], **fields):
+    """Append one file's rows to per-column lists: one per item, or a single metadata-only row"""
+    row_count = max(1, len(items["S No"]))
+    # Stamped now rather than at parse time, since parses are reused across runs
+    shared = {**metadata, "Processing Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **fields}
+    for column, values in columns.items():
+        if items.get(column):
+            values.extend(items[column])
+        else:
+            values.extend([shared.get(column)] * row_count)
+
+def build_result_frame(columns: Dict[str, list]) -> pd.DataFrame:
+    """Build the result DataFrame from per-column lists, with repeated fields as categoricals"""
+    # Header, file and source values repeat on every item row, so store each distinct value once
+    return pd.DataFrame({
+        column: pd.Categorical(values) if column in CATEGORICAL_RESULT_COLUMNS else values
+        for column, values in columns.items()
+    })
+
+def needs_csv_quoting(df: pd.DataFrame) -> bool:
+    """Check whether any text value contains a character that CSV must quote"""
+    for column in df.columns:
+        values = df[column]
+        # Categoricals are checked once per distinct value rather than per row
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.categories.to_series()
+        elif not pd.api.types.is_string_dtype(values.dtype):
+            continue
+        # Literal substring scans are several times faster than one regex character class
+        values = values.astype(str)
+        if any(values.str.contains(char, regex=False).any() for char in CSV_QUOTE_CHARS):
+            return True
+    return False
+
+def dataframe_to_csv(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to CSV bytes with pyarrow's multithreaded writer"""
+    # Unquoted fields and a pandas-written header keep the output identical to to_csv;
+    # values that would need quoting (e.g. commas in addresses) go straight to pandas
+    if needs_csv_quoting(df):
+        return df.to_csv(index=False).encode('utf-8')
+    try:
+        buffer = BytesIO()
+        buffer.write(df.head(0).to_csv(index=False).encode('utf-8'))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # arrow's CSV writer is ~10x slower on dictionary columns, so decode categoricals first
+        table = pa.Table.from_arrays(
+            [column.cast(column.type.value_type) if pa.types.is_dictionary(column.type) else column
+             for column in table.columns],
+            names=table.column_names
+        )
+        pacsv.write_csv(
+            table, buffer,
+            pacsv.WriteOptions(include_header=False, quoting_style='none')
+        )
+        return buffer.getvalue()
+    except (pa.ArrowException, TypeError, ValueError):
+        # Columns arrow can't convert (e.g. mixed-type objects) go through pandas' writer
+        return df.to_csv(index=False).encode('utf-8')
+
+def dataframe_to_xlsx(df: pd.DataFrame, sheet_name: str = 'GRN_Data') -> bytes:
+    """Serialize a DataFrame to xlsx bytes, streaming rows to disk in constant-memory mode"""
+    # pandas' to_excel writes cell by cell column-major, which constant_memory mode
+    # can't handle, so rows are written directly
+    buffer = BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True, 'strings_to_urls': False})
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, list(df.columns), workbook.add_format({'bold': True, 'border': 1}))
+    for row_number, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        # NaN != NaN, so missing values become blank cells
+        worksheet.write_row(row_number, 0, [None if pd.isna(value) else value for value in row])
+    workbook.close()
+    return buffer.getvalue()
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def export_result(result_id: str, file_format: str, _df: pd.DataFrame) -> bytes:
+    """Serialize a result frame for download, once per result_id and format"""
+    if file_format == 'csv':
+        return dataframe_to_csv(_df)
+    return dataframe_to_xlsx(_df)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def compute_result_metrics(result_id: str, _df: pd.DataFrame) -> Dict[str, Any]:
+    """Summary counts for a result frame, computed once per result_id rather than on every rerun"""
+    has_grn = 'GRN No' in _df.columns
+    return {
+        'total_records': len(_df),
+        'unique_grns': _df['GRN No'].nunique() if has_grn else 0,
+        'unique_files': _df['file_name'].nunique() if 'file_name' in _df.columns else 0,
+        'success_rate': (_df['GRN No'].notna().sum() / len(_df) * 100) if has_grn else 0,
+    }
+
+def render_metric_cards(cards: List[tuple]):
+    """Render (value, label[, value_style]) metric cards side by side in one markdown block"""
+    html = ""
+    for value, label, *value_style in cards:
+        style = f' style="{value_style[0]}"' if value_style else ""
+        html += (
+            f'<div class="metric-card"><span class="metric-value"{style}>{value}</span>'
+            f'<div class="metric-label">{label}</div></div>'
+        )
+    st.markdown(f'<div class="metrics-row">{html}</div>', unsafe_allow_html=True)
 
 # Session State Initialization
 if 'df_result' not in st.session_state:
     st.session_state.df_result = None
+if 'result_id' not in st.session_state:
+    st.session_state.result_id = None
 if 'processing_complete' not in st.session_state:
     st.session_state.processing_complete = False
 if 'sheets_uploaded' not in st.session_state:
     st.session_state.sheets_uploaded = False
+if 'parsed_drive_files' not in st.session_state:
+    st.session_state.parsed_drive_files = {}
+if 'parsed_upload_files' not in st.session_state:
+    st.session_state.parsed_upload_files = {}
+if 'sheet_layouts' not in st.session_state:
+    st.session_state.sheet_layouts = {}
+if 'sheet_rows_sent' not in st.session_state:
+    st.session_state.sheet_rows_sent = {}
 
 # Header Section
 st.markdown("""
@@ -621,68 +688,53 @@ with tab1:
     
     if uploaded_files:
         # File Metrics
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown(f"""
-            <div class="metric-card">
-                <span class="metric-value">{len(uploaded_files)}</span>
-                <div class="metric-label">Files Uploaded</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            total_size = sum(file.size for file in uploaded_files) / (1024 * 1024)
-            st.markdown(f"""
-            <div class="metric-card">
-                <span class="metric-value">{total_size:.2f}</span>
-                <div class="metric-label">Total Size (MB)</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            avg_size = total_size / len(uploaded_files)
-            st.markdown(f"""
-            <div class="metric-card">
-                <span class="metric-value">{avg_size:.2f}</span>
-                <div class="metric-label">Avg Size (MB)</div>
-            </div>
-            """, unsafe_allow_html=True)
+        total_size = sum(file.size for file in uploaded_files) / (1024 * 1024)
+        avg_size = total_size / len(uploaded_files)
+        render_metric_cards([
+            (len(uploaded_files), "Files Uploaded"),
+            (f"{total_size:.2f}", "Total Size (MB)"),
+            (f"{avg_size:.2f}", "Avg Size (MB)"),
+        ])
         
         # Processing Section
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🚀 Process Manual PDFs", key="process_manual_btn", help="Process uploaded PDF files"):
-                processor = RelianceGRNProcessor()
                 with st.spinner("🔄 Processing your files..."):
                     progress_bar = st.progress(0)
                     status_text = st.empty()
-                    all_data = []
-                    
-                    for i, file in enumerate(uploaded_files):
-                        status_text.text(f"Processing: {file.name}")
-                        
-                        text = processor.extract_text_from_pdf(file.read())
-                        metadata, items = processor.extract_grn_data(text, file.name)
-                        
-                        if not items:
-                            row = defaultdict(lambda: "")
-                            row.update(metadata)
-                            row["file_name"] = file.name
-                            row["source"] = "manual"
-                            all_data.append(row)
+                    all_data = {column: [] for column in MANUAL_RESULT_COLUMNS}
+
+                    # Files already parsed this session are reused when their content and name match
+                    parsed_uploads = st.session_state.parsed_upload_files
+                    upload_keys = [
+                        (hashlib.blake2b(file.getvalue(), digest_size=16).hexdigest(), file.name)
+                        for file in uploaded_files
+                    ]
+                    pending = [i for i, key in enumerate(upload_keys) if key not in parsed_uploads]
+
+                    pdfs = (
+                        (position, uploaded_files[i].name, uploaded_files[i].getvalue())
+                        for position, i in enumerate(pending)
+                    )
+                    # Failed parses still get their empty row this run but are retried next time
+                    failed = {}
+                    for position, metadata, items, ok in parse_pdf_batch(pdfs, len(pending), progress_bar, status_text):
+                        key = upload_keys[pending[position]]
+                        if ok:
+                            parsed_uploads[key] = (metadata, items)
                         else:
-                            for item in items:
-                                row = {**metadata, **item, "file_name": file.name, "source": "manual"}
-                                all_data.append(row)
-                        
-                        progress_bar.progress((i + 1) / len(uploaded_files))
-                        time.sleep(0.1)
-                    
+                            failed[key] = (metadata, items)
+
+                    for file, key in zip(uploaded_files, upload_keys):
+                        metadata, items = parsed_uploads.get(key) or failed[key]
+                        append_file_rows(all_data, metadata, items, file_name=file.name, source="manual")
+
                     status_text.text("✅ Processing complete!")
                     
-                    if all_data:
-                        st.session_state.df_result = pd.DataFrame(all_data)
+                    if all_data["file_name"]:
+                        st.session_state.df_result = build_result_frame(all_data)
+                        st.session_state.result_id = uuid.uuid4().hex
                         st.session_state.processing_complete = True
                         st.session_state.sheets_uploaded = False
                         st.success("🎉 All manual files processed successfully!")
@@ -697,7 +749,7 @@ with tab2:
     st.markdown('<div class="workflow-section animate-fade-in">', unsafe_allow_html=True)
     st.markdown('<div class="section-header"><span class="section-icon">☁️</span>Google Drive Processing Workflow</div>', unsafe_allow_html=True)
     
-    processor = RelianceGRNProcessor()
+    processor = get_processor()
     
     # Authentication Section
     st.markdown("#### 🔐 Google Services Authentication")
@@ -720,50 +772,22 @@ with tab2:
             )
         
         if drive_files:
-            # Drive Files Metrics
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.markdown(f"""
-                <div class="metric-card">
-                    <span class="metric-value">{len(drive_files)}</span>
-                    <div class="metric-label">Drive Files Found</div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col2:
-                total_size = sum(int(f.get('size', 0)) for f in drive_files) / (1024 * 1024)
-                st.markdown(f"""
-                <div class="metric-card">
-                    <span class="metric-value">{total_size:.2f}</span>
-                    <div class="metric-label">Total Size (MB)</div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col3:
-                oldest_file = min(drive_files, key=lambda x: x['createdTime'])['createdTime']
-                oldest_date = datetime.fromisoformat(oldest_file.replace('Z', '+00:00')).strftime('%Y-%m-%d')
-                st.markdown(f"""
-                <div class="metric-card">
-                    <span class="metric-value" style="font-size: 1.5rem;">{oldest_date}</span>
-                    <div class="metric-label">Oldest File Date</div>
-                </div>
-                """, unsafe_allow_html=True)
+            # One frame feeds both the metrics and the files table
+            files_df = pd.DataFrame(drive_files)
+            created = pd.to_datetime(files_df['createdTime'])
+            size_bytes = files_df.get('size', pd.Series(0, index=files_df.index)).fillna(0).astype('int64')
             
-            with col4:
-                newest_file = max(drive_files, key=lambda x: x['createdTime'])['createdTime']
-                newest_date = datetime.fromisoformat(newest_file.replace('Z', '+00:00')).strftime('%Y-%m-%d')
-                st.markdown(f"""
-                <div class="metric-card">
-                    <span class="metric-value" style="font-size: 1.5rem;">{newest_date}</span>
-                    <div class="metric-label">Newest File Date</div>
-                </div>
-                """, unsafe_allow_html=True)
+            # Drive Files Metrics
+            render_metric_cards([
+                (len(drive_files), "Drive Files Found"),
+                (f"{size_bytes.sum() / (1024 * 1024):.2f}", "Total Size (MB)"),
+                (created.min().strftime('%Y-%m-%d'), "Oldest File Date", "font-size: 1.5rem;"),
+                (created.max().strftime('%Y-%m-%d'), "Newest File Date", "font-size: 1.5rem;"),
+            ])
             
             # Display files table
-            files_df = pd.DataFrame(drive_files)
-            files_df['created_date'] = pd.to_datetime(files_df['createdTime']).dt.strftime('%Y-%m-%d %H:%M')
-            files_df['size_mb'] = (files_df['size'].astype(int) / (1024 * 1024)).round(2)
+            files_df['created_date'] = created.dt.strftime('%Y-%m-%d %H:%M')
+            files_df['size_mb'] = (size_bytes / (1024 * 1024)).round(2)
             
             display_df = files_df[['name', 'created_date', 'size_mb']].rename(columns={
                 'name': 'File Name',
@@ -780,39 +804,45 @@ with tab2:
                     with st.spinner("📄 Processing Drive files..."):
                         progress_bar = st.progress(0)
                         status_text = st.empty()
-                        all_data = []
-                        
-                        for i, file in enumerate(drive_files):
-                            status_text.text(f"Processing: {file['name']}")
-                            
-                            # Download file
-                            file_data = processor.download_from_drive(file['id'])
-                            if file_data:
-                                text = processor.extract_text_from_pdf(file_data)
-                                metadata, items = processor.extract_grn_data(text, file['name'])
-                                
-                                if not items:
-                                    row = defaultdict(lambda: "")
-                                    row.update(metadata)
-                                    row["file_name"] = file['name']
-                                    row["source"] = "drive"
-                                    row["drive_file_id"] = file['id']
-                                    all_data.append(row)
-                                else:
-                                    for item in items:
-                                        row = {**metadata, **item, 
-                                               "file_name": file['name'], 
-                                               "source": "drive",
-                                               "drive_file_id": file['id']}
-                                        all_data.append(row)
-                            
-                            progress_bar.progress((i + 1) / len(drive_files))
-                            time.sleep(0.1)
+                        all_data = {column: [] for column in DRIVE_RESULT_COLUMNS}
                         
+                        # Files already parsed this session are reused until they change in Drive
+                        parsed_files = st.session_state.parsed_drive_files
+                        pending = [
+                            file for file in drive_files
+                            if (file['id'], file.get('modifiedTime')) not in parsed_files
+                        ]
+
+                        # Parse each PDF as soon as its download lands
+                        positions = {file['id']: i for i, file in enumerate(pending)}
+                        pdfs = (
+                            (positions[file_id], pending[positions[file_id]]['name'], file_data or None)
+                            for file_id, file_data in processor.iter_downloads(list(positions))
+                        )
+                        # Failed parses still get their empty row this run but are retried next time
+                        failed = {}
+                        for i, metadata, items, ok in parse_pdf_batch(pdfs, len(pending), progress_bar, status_text):
+                            file = pending[i]
+                            key = (file['id'], file.get('modifiedTime'))
+                            if ok:
+                                parsed_files[key] = (metadata, items)
+                            else:
+                                failed[key] = (metadata, items)
+
+                        for file in drive_files:
+                            key = (file['id'], file.get('modifiedTime'))
+                            parsed = parsed_files.get(key) or failed.get(key)
+                            if parsed is None:
+                                continue
+                            metadata, items = parsed
+                            append_file_rows(all_data, metadata, items,
+                                             file_name=file['name'], source="drive", drive_file_id=file['id'])
+
                         status_text.text("✅ Processing complete!")
                         
-                        if all_data:
-                            st.session_state.df_result = pd.DataFrame(all_data)
+                        if all_data["file_name"]:
+                            st.session_state.df_result = build_result_frame(all_data)
+                            st.session_state.result_id = uuid.uuid4().hex
                             st.session_state.processing_complete = True
                             st.session_state.sheets_uploaded = False
                             st.success("🎉 All Drive files processed successfully!")
@@ -833,42 +863,13 @@ if st.session_state.processing_complete and st.session_state.df_result is not No
     
     if not df.empty:
         # Results Metrics
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.markdown(f"""
-            <div class="metric-card">
-                <span class="metric-value">{len(df)}</span>
-                <div class="metric-label">Total Records</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            unique_grns = df['GRN No'].nunique() if 'GRN No' in df.columns else 0
-            st.markdown(f"""
-            <div class="metric-card">
-                <span class="metric-value">{unique_grns}</span>
-                <div class="metric-label">Unique GRNs</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            unique_files = df['file_name'].nunique() if 'file_name' in df.columns else 0
-            st.markdown(f"""
-            <div class="metric-card">
-                <span class="metric-value">{unique_files}</span>
-                <div class="metric-label">Files Processed</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col4:
-            success_rate = (df['GRN No'].notna().sum() / len(df) * 100) if 'GRN No' in df.columns else 0
-            st.markdown(f"""
-            <div class="metric-card">
-                <span class="metric-value">{success_rate:.1f}%</span>
-                <div class="metric-label">Success Rate</div>
-            </div>
-            """, unsafe_allow_html=True)
+        metrics = compute_result_metrics(st.session_state.result_id, df)
+        render_metric_cards([
+            (metrics['total_records'], "Total Records"),
+            (metrics['unique_grns'], "Unique GRNs"),
+            (metrics['unique_files'], "Files Processed"),
+            (f"{metrics['success_rate']:.1f}%", "Success Rate"),
+        ])
         
         # Data Preview
         st.markdown("#### 🔍 Data Preview")
@@ -878,11 +879,10 @@ if st.session_state.processing_complete and st.session_state.df_result is not No
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            # Download as CSV
-            csv = df.to_csv(index=False)
+            # Download as CSV; files are serialized on first click and reused after
             st.download_button(
                 label="📥 Download CSV",
-                data=csv,
+                data=partial(export_result, st.session_state.result_id, 'csv', df),
                 file_name=f"grn_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                 mime="text/csv",
                 key="download_csv"
@@ -890,13 +890,9 @@ if st.session_state.processing_complete and st.session_state.df_result is not No
         
         with col2:
             # Download as Excel
-            buffer = BytesIO()
-            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='GRN_Data', index=False)
-            
             st.download_button(
                 label="📊 Download Excel",
-                data=buffer.getvalue(),
+                data=partial(export_result, st.session_state.result_id, 'xlsx', df),
                 file_name=f"grn_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 key="download_excel"
@@ -906,20 +902,18 @@ if st.session_state.processing_complete and st.session_state.df_result is not No
             # Upload to Google Sheets
             if not st.session_state.sheets_uploaded:
                 if st.button("📋 Upload to Google Sheets", key="upload_sheets_btn"):
-                    processor = RelianceGRNProcessor()
+                    processor = get_processor()
                     
                     # Re-authenticate if needed
                     progress_bar = st.progress(0)
                     status_text = st.empty()
                     
                     if processor.authenticate_from_secrets(progress_bar, status_text):
-                        # Convert DataFrame to list of dictionaries
-                        data_list = df.to_dict('records')
-                        
                         # Upload to the hardcoded sheet
                         sheet_id = HARDCODED_CONFIG['drive_to_sheet']['sheet_id']
                         
-                        if processor.append_to_sheet(sheet_id, data_list, progress_bar, status_text):
+                        if processor.append_to_sheet(sheet_id, df, progress_bar, status_text,
+                                                     upload_id=st.session_state.result_id):
                             st.session_state.sheets_uploaded = True
                             st.rerun()
                     else:
@@ -970,6 +964,8 @@ if st.session_state.processing_complete:
             st.session_state.df_result = None
             st.session_state.processing_complete = False
             st.session_state.sheets_uploaded = False
+            st.session_state.parsed_drive_files = {}
+            st.session_state.parsed_upload_files = {}
             st.success("✅ All data cleared successfully!")
             st.rerun()
 